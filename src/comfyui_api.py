@@ -5,28 +5,61 @@ Simple FastAPI server that interfaces directly with ComfyUI WebSocket API
 Loads specific workflow and accepts prompt format node updates
 """
 
-import json
+import asyncio
+import atexit
+import hashlib
+import itertools
 import os
+import queue
+import time
+import secrets
 import uuid
-import websocket
-import urllib.request
-import urllib.parse
-import requests
+import websockets
+import httpx
+import orjson
+from cachetools import LRUCache, TTLCache
 import logging
-from typing import Dict, Any, Optional
-from fastapi import FastAPI, HTTPException
+from logging.handlers import QueueHandler, QueueListener
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict, Any, List, Optional
+from fastapi import FastAPI, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from pathlib import Path
+from fastapi.responses import ORJSONResponse, RedirectResponse, StreamingResponse
+from fastapi.exceptions import RequestValidationError
+from pydantic import BaseModel, Field, ValidationError
+from starlette.background import BackgroundTask
+from urllib.parse import urlencode
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# SIMD-accelerated base64 when available, stdlib otherwise
+try:
+    import pybase64 as base64
+except ImportError:
+    import base64
+
+# Configure logging; records are queued and written by a background listener
+log_queue = queue.SimpleQueue()
+logging.basicConfig(level=logging.INFO, handlers=[QueueHandler(log_queue)])
+log_listener = QueueListener(log_queue, logging.StreamHandler())
+log_listener.start()
+atexit.register(log_listener.stop)
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start the background tasks and close the shared HTTP client on shutdown"""
+    listener = asyncio.create_task(completion_listener())
+    prober = asyncio.create_task(health_probe_loop())
+    yield
+    listener.cancel()
+    prober.cancel()
+    await async_http_client.aclose()
+
 app = FastAPI(
     title="ComfyUI FastAPI Interface",
     description="Direct ComfyUI WebSocket API interface with workflow support",
-    version="3.0.0"
+    version="3.0.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
 # Add CORS middleware
@@ -40,42 +73,129 @@ app.add_middleware(
 
 # Configuration
 COMFYUI_SERVER = "127.0.0.1:8188"
+COMFYUI_PUBLIC_URL = os.getenv("COMFYUI_PUBLIC_URL")  # ComfyUI base URL reachable by clients, if any
 WORKFLOW_FILE = "/ComfyUI/user/default/workflows/Wrapper-SelfForcing-ImageToVideo-60FPS-API.json"
 CLIENT_ID = str(uuid.uuid4())
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024  # Read size when streaming outputs through the API
+PROMPT_CACHE_SIZE = 256  # Built prompts kept for repeated prompt updates
+PROMPT_CACHE_MAX_KEY_BYTES = 64 * 1024  # Larger updates are not cached
+WORKFLOW_CHECK_INTERVAL = 5.0  # Seconds between checks of the workflow file for edits
+HEALTH_PROBE_INTERVAL = 5.0  # Seconds between background ComfyUI health probes
+
+# Async client for endpoints, so ComfyUI calls do not block the event loop
+async_http_client = httpx.AsyncClient(
+    base_url=f"http://{COMFYUI_SERVER}",
+    timeout=10,
+    limits=httpx.Limits(max_keepalive_connections=64, max_connections=128)
+)
 
 class WorkflowManager:
     """Manages the ComfyUI workflow loading and processing"""
     
     def __init__(self, workflow_path: str):
         self.workflow_path = workflow_path
+        self._file_stamp = None
+        self._next_check = 0.0
         self.base_workflow = self._load_workflow()
+        self._prompt_cache = LRUCache(maxsize=PROMPT_CACHE_SIZE)
+        self._info_json = None
+        self._info_etag = None
     
     def _load_workflow(self) -> Dict:
         """Load the workflow from JSON file"""
         try:
-            with open(self.workflow_path, 'r') as f:
-                workflow = json.load(f)
+            with open(self.workflow_path, 'rb') as f:
+                stat = os.fstat(f.fileno())
+                workflow = orjson.loads(f.read())
+            self._file_stamp = (stat.st_mtime_ns, stat.st_size)
             logger.info(f"Loaded workflow from {self.workflow_path}")
             return workflow
         except Exception as e:
             logger.error(f"Error loading workflow: {e}")
             return {}
     
+    def refresh(self) -> None:
+        """Reload the workflow if its file changed, checking at most every few seconds"""
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        self._next_check = now + WORKFLOW_CHECK_INTERVAL
+        
+        try:
+            stat = os.stat(self.workflow_path)
+        except OSError:
+            return
+        if (stat.st_mtime_ns, stat.st_size) != self._file_stamp:
+            workflow = self._load_workflow()
+            if workflow:
+                self.base_workflow = workflow
+                self._prompt_cache.clear()
+                self._info_json = None
+    
+    def info_etag(self) -> str:
+        """Entity tag of info_json(), for conditional requests"""
+        self.info_json()
+        return self._info_etag
+    
+    def info_json(self) -> bytes:
+        """Serialized workflow node information, built once per loaded workflow"""
+        if self._info_json is None:
+            nodes_info = {}
+            for node_id, node_data in self.base_workflow.items():
+                nodes_info[node_id] = {
+                    "class_type": node_data.get("class_type"),
+                    "inputs": list(node_data.get("inputs", {}).keys()),
+                    "title": node_data.get("_meta", {}).get("title", "")
+                }
+            
+            self._info_json = orjson.dumps({
+                "workflow_file": self.workflow_path,
+                "total_nodes": len(self.base_workflow),
+                "nodes": nodes_info
+            })
+            self._info_etag = f'"{hashlib.sha256(self._info_json).hexdigest()[:32]}"'
+        return self._info_json
+    
     def create_prompt(self, prompt_updates: Dict[str, Any]) -> Dict:
-        """Create a ComfyUI prompt by updating the base workflow"""
-        # Start with base workflow
-        prompt = json.loads(json.dumps(self.base_workflow))
+        """Create a ComfyUI prompt, reusing the prompt built for identical updates
+        
+        Prompts are cached and shared between requests, so they must never be
+        mutated. Updates too large to key cheaply (e.g. inline base64 images)
+        are built fresh every time.
+        """
+        key = orjson.dumps(prompt_updates, option=orjson.OPT_SORT_KEYS)
+        if len(key) > PROMPT_CACHE_MAX_KEY_BYTES:
+            return self._build_prompt(prompt_updates)
+        
+        prompt = self._prompt_cache.get(key)
+        if prompt is None:
+            prompt = self._prompt_cache[key] = self._build_prompt(prompt_updates)
+        return prompt
+    
+    def _build_prompt(self, prompt_updates: Dict[str, Any]) -> Dict:
+        """Create a ComfyUI prompt by updating the base workflow
+        
+        Unchanged nodes are shared with base_workflow; only updated nodes
+        and their inputs are copied, so the base must never be mutated.
+        """
+        # Start with a shallow copy of the base workflow
+        prompt = dict(self.base_workflow)
         
         # Apply updates from the prompt_updates
         for node_id, node_data in prompt_updates.items():
             if node_id in prompt:
+                base_node = prompt[node_id]
+                node = dict(base_node)
+                
                 # Update inputs if provided
                 if "inputs" in node_data:
-                    prompt[node_id]["inputs"].update(node_data["inputs"])
+                    node["inputs"] = {**base_node.get("inputs", {}), **node_data["inputs"]}
                 
                 # Update class_type if provided (usually not needed)
                 if "class_type" in node_data:
-                    prompt[node_id]["class_type"] = node_data["class_type"]
+                    node["class_type"] = node_data["class_type"]
+                
+                prompt[node_id] = node
             else:
                 # Add new node if it doesn't exist
                 prompt[node_id] = node_data
@@ -86,86 +206,79 @@ class ComfyUIClient:
     """Handles ComfyUI WebSocket communication"""
     
     @staticmethod
-    def queue_prompt(prompt: Dict) -> Dict:
-        """Submit prompt to ComfyUI API"""
+    async def aqueue_prompt(prompt: Dict, prompt_id: Optional[str] = None) -> Dict:
+        """Submit prompt to ComfyUI API without blocking the event loop"""
         p = {"prompt": prompt, "client_id": CLIENT_ID}
-        data = json.dumps(p).encode('utf-8')
-        req = urllib.request.Request(f"http://{COMFYUI_SERVER}/prompt", data=data)
-        return json.loads(urllib.request.urlopen(req).read())
-    
-    @staticmethod
-    def get_image(filename: str, subfolder: str, folder_type: str) -> bytes:
-        """Download image/video from ComfyUI"""
-        data = {"filename": filename, "subfolder": subfolder, "type": folder_type}
-        url_values = urllib.parse.urlencode(data)
-        with urllib.request.urlopen(f"http://{COMFYUI_SERVER}/view?{url_values}") as response:
-            return response.read()
-    
-    @staticmethod
-    def get_history(prompt_id: str) -> Dict:
-        """Get execution history for a prompt"""
-        with urllib.request.urlopen(f"http://{COMFYUI_SERVER}/history/{prompt_id}") as response:
-            return json.loads(response.read())
+        if prompt_id is not None:
+            p["prompt_id"] = prompt_id
+        response = await async_http_client.post(
+            "/prompt",
+            content=orjson.dumps(p),
+            headers={"Content-Type": "application/json"}
+        )
+        response.raise_for_status()
+        return orjson.loads(response.content)
     
     @staticmethod
-    def get_outputs(prompt_id: str) -> Dict:
-        """Get all outputs for a completed job"""
-        history = ComfyUIClient.get_history(prompt_id)[prompt_id]
-        output_files = {}
-        
-        for node_id in history['outputs']:
-            node_output = history['outputs'][node_id]
-            if 'videos' in node_output:
-                videos = []
-                for video in node_output['videos']:
-                    video_data = ComfyUIClient.get_image(
-                        video['filename'], 
-                        video['subfolder'], 
-                        video['type']
-                    )
-                    videos.append({
-                        'filename': video['filename'],
-                        'data': video_data
-                    })
-                output_files[node_id] = {'videos': videos}
-            
-            elif 'images' in node_output:
-                images = []
-                for image in node_output['images']:
-                    image_data = ComfyUIClient.get_image(
-                        image['filename'], 
-                        image['subfolder'], 
-                        image['type']
-                    )
-                    images.append({
-                        'filename': image['filename'],
-                        'data': image_data
-                    })
-                output_files[node_id] = {'images': images}
-        
-        return output_files
+    async def aget_history(prompt_id: str) -> Dict:
+        """Get execution history for a prompt without blocking the event loop"""
+        response = await async_http_client.get(f"/history/{prompt_id}")
+        response.raise_for_status()
+        return orjson.loads(response.content)
+
+# prompt_id -> asyncio.Event set when ComfyUI finishes executing the prompt
+prompt_events: Dict[str, asyncio.Event] = {}
+
+def release_prompt_event(prompt_id: str) -> None:
+    """Forget a finished prompt's completion event, waking anyone still waiting on it
     
-    @staticmethod
-    def wait_for_completion(prompt_id: str) -> bool:
-        """Wait for job completion using WebSocket"""
+    Called by the listener and whenever history shows the prompt finished, so
+    completions the listener missed (e.g. while reconnecting) do not leak.
+    """
+    event = prompt_events.pop(prompt_id, None)
+    if event is not None:
+        event.set()
+
+async def completion_listener() -> None:
+    """Hold one ComfyUI WebSocket and signal job waiters on completion"""
+    while True:
         try:
-            ws = websocket.WebSocket()
-            ws.connect(f"ws://{COMFYUI_SERVER}/ws?clientId={CLIENT_ID}")
-            
-            while True:
-                out = ws.recv()
-                if isinstance(out, str):
-                    message = json.loads(out)
-                    if message['type'] == 'executing':
-                        data = message['data']
-                        if data['node'] is None and data['prompt_id'] == prompt_id:
-                            ws.close()
-                            return True
-                # Continue for binary data (previews)
-            
+            async with websockets.connect(
+                f"ws://{COMFYUI_SERVER}/ws?clientId={CLIENT_ID}",
+                max_size=None  # Preview frames can exceed the default limit
+            ) as ws:
+                logger.info("Completion listener connected to ComfyUI")
+                
+                async for out in ws:
+                    if isinstance(out, str):
+                        message = orjson.loads(out)
+                        if message['type'] == 'executing':
+                            data = message['data']
+                            if data['node'] is None:
+                                release_prompt_event(data.get('prompt_id'))
+                    # Continue for binary data (previews)
+        
+        except asyncio.CancelledError:
+            raise
         except Exception as e:
-            logger.error(f"WebSocket error: {e}")
-            return False
+            logger.error(f"Completion listener error: {e}, reconnecting")
+            await asyncio.sleep(2)
+
+# Last ComfyUI health probe result, refreshed in the background and served by /health
+comfyui_status = "unknown"
+
+async def health_probe_loop() -> None:
+    """Probe ComfyUI periodically so /health never waits on it"""
+    global comfyui_status
+    while True:
+        try:
+            response = await async_http_client.get("/system_stats", timeout=2)
+            comfyui_status = "healthy" if response.status_code == 200 else "unhealthy"
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            comfyui_status = "unreachable"
+        await asyncio.sleep(HEALTH_PROBE_INTERVAL)
 
 # Initialize workflow manager
 workflow_manager = WorkflowManager(WORKFLOW_FILE)
@@ -188,56 +301,92 @@ class JobStatus(BaseModel):
     outputs: Optional[Dict] = None
     error: Optional[str] = None
 
-# Store active jobs
-active_jobs = {}
+class BatchStatusRequest(BaseModel):
+    job_ids: List[str] = Field(min_length=1, max_length=500)
 
-@app.get("/")
-async def root():
-    """Root endpoint with service information"""
-    return {
+class BatchStatusResponse(BaseModel):
+    statuses: List[JobStatus]
+    missing: List[str]
+
+# Store active jobs, evicting the oldest beyond 10k entries or after 24 hours
+active_jobs = TTLCache(maxsize=10000, ttl=24 * 60 * 60)
+
+# Service information bodies, serialized once, keyed by whether a workflow is loaded
+ROOT_RESPONSES = {
+    loaded: orjson.dumps({
         "service": "ComfyUI FastAPI Interface",
         "version": "3.0.0",
         "description": "Direct ComfyUI WebSocket API interface",
         "comfyui_server": COMFYUI_SERVER,
-        "workflow_loaded": bool(workflow_manager.base_workflow)
-    }
+        "workflow_loaded": loaded
+    })
+    for loaded in (False, True)
+}
+
+@app.get("/")
+async def root():
+    """Root endpoint with service information"""
+    workflow_manager.refresh()
+    return Response(ROOT_RESPONSES[bool(workflow_manager.base_workflow)], media_type="application/json")
 
 @app.get("/health")
 async def health_check():
-    """Health check endpoint"""
-    try:
-        # Check ComfyUI connectivity
-        response = requests.get(f"http://{COMFYUI_SERVER}/system_stats", timeout=5)
-        comfyui_status = "healthy" if response.status_code == 200 else "unhealthy"
-    except:
-        comfyui_status = "unreachable"
-    
+    """Health check endpoint, reporting the last background ComfyUI probe"""
     return {
         "status": "healthy",
         "comfyui_status": comfyui_status,
         "workflow_loaded": bool(workflow_manager.base_workflow)
     }
 
-@app.post("/generate", response_model=GenerateResponse)
-async def generate(request: GenerateRequest):
+@app.post(
+    "/generate",
+    response_model=GenerateResponse,
+    openapi_extra={"requestBody": {
+        "required": True,
+        "content": {"application/json": {"schema": GenerateRequest.model_json_schema()}}
+    }}
+)
+async def generate(raw_request: Request):
     """Generate video using ComfyUI workflow with prompt updates"""
     
+    # Parse and validate in one pass with pydantic's native JSON parser instead
+    # of FastAPI's stdlib json decode; bodies can carry multi-MB base64 images
+    try:
+        request = GenerateRequest.model_validate_json(await raw_request.body())
+    except ValidationError as e:
+        raise RequestValidationError(e.errors())
+    
     try:
-        # Create the final prompt
+        # Create the final prompt, picking up edits to the workflow file
+        workflow_manager.refresh()
         final_prompt = workflow_manager.create_prompt(request.prompt)
         
+        # Register the completion event before submitting so it cannot be missed
+        requested_id = str(uuid.uuid4())
+        done = asyncio.Event()
+        prompt_events[requested_id] = done
+        
         # Submit to ComfyUI
-        result = ComfyUIClient.queue_prompt(final_prompt)
+        try:
+            result = await ComfyUIClient.aqueue_prompt(final_prompt, requested_id)
+        except Exception:
+            prompt_events.pop(requested_id, None)
+            raise
         prompt_id = result['prompt_id']
         
+        # Older ComfyUI versions ignore the requested id and assign their own
+        if prompt_id != requested_id:
+            prompt_events[prompt_id] = prompt_events.pop(requested_id)
+        
         # Generate job ID
-        job_id = str(uuid.uuid4())
+        job_id = secrets.token_urlsafe(16)
         
         # Store job info
         active_jobs[job_id] = {
             'prompt_id': prompt_id,
             'status': 'queued',
-            'webhook': request.webhook
+            'webhook': request.webhook,
+            'done': done
         }
         
         logger.info(f"Job {job_id} submitted with prompt_id {prompt_id}")
@@ -250,7 +399,7 @@ async def generate(request: GenerateRequest):
         )
         
     except Exception as e:
-        logger.error(f"Error submitting job: {e}")
+        logger.exception("Error submitting job")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/status/{job_id}", response_model=JobStatus)
@@ -266,11 +415,12 @@ async def get_status(job_id: str):
         
         # Check history for completion
         try:
-            history = ComfyUIClient.get_history(prompt_id)
+            history = await ComfyUIClient.aget_history(prompt_id)
             if prompt_id in history:
                 job_data = history[prompt_id]
                 if 'outputs' in job_data:
                     # Job completed
+                    release_prompt_event(prompt_id)
                     active_jobs[job_id]['status'] = 'completed'
                     return JobStatus(
                         job_id=job_id,
@@ -298,34 +448,160 @@ async def get_status(job_id: str):
             error=str(e)
         )
 
-@app.get("/download/{job_id}")
-async def download_result(job_id: str):
-    """Download job result"""
+@app.post("/status/batch", response_model=BatchStatusResponse)
+async def get_status_batch(request: BatchStatusRequest):
+    """Get the status of many jobs in one request"""
+    job_ids = list(dict.fromkeys(request.job_ids))
+    known = [job_id for job_id in job_ids if job_id in active_jobs]
+    statuses = await asyncio.gather(*(get_status(job_id) for job_id in known))
+    return BatchStatusResponse(
+        statuses=statuses,
+        missing=[job_id for job_id in job_ids if job_id not in known]
+    )
+
+@app.get("/wait/{job_id}", response_model=JobStatus)
+async def wait_for_job(job_id: str, timeout: float = 600):
+    """Wait for job completion and return its outputs"""
     
     if job_id not in active_jobs:
         raise HTTPException(status_code=404, detail="Job not found")
     
+    job_info = active_jobs[job_id]
+    prompt_id = job_info['prompt_id']
+    done = job_info['done']
+    
     try:
-        job_info = active_jobs[job_id]
-        prompt_id = job_info['prompt_id']
+        # Completion may have landed before the event was registered
+        history = await ComfyUIClient.aget_history(prompt_id)
+        if 'outputs' not in history.get(prompt_id, {}):
+            await asyncio.wait_for(done.wait(), timeout=timeout)
+            history = await ComfyUIClient.aget_history(prompt_id)
         
-        # Get outputs
-        outputs = ComfyUIClient.get_outputs(prompt_id)
+        release_prompt_event(prompt_id)
+        active_jobs[job_id]['status'] = 'completed'
+        return JobStatus(
+            job_id=job_id,
+            prompt_id=prompt_id,
+            status="completed",
+            outputs=history.get(prompt_id, {}).get('outputs')
+        )
+    
+    except asyncio.TimeoutError:
+        return JobStatus(
+            job_id=job_id,
+            prompt_id=prompt_id,
+            status=active_jobs[job_id]['status']
+        )
+    except Exception as e:
+        logger.error(f"Error waiting for job: {e}")
+        active_jobs[job_id]['status'] = 'error'
+        return JobStatus(
+            job_id=job_id,
+            prompt_id=prompt_id,
+            status="error",
+            error=str(e)
+        )
+
+async def find_job_video(job_id: str) -> Dict[str, Any]:
+    """Return the first video output of a job, raising 404 when unavailable"""
+    
+    if job_id not in active_jobs:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    prompt_id = active_jobs[job_id]['prompt_id']
+    
+    # Get output metadata; the file itself is served by ComfyUI's /view
+    history = await ComfyUIClient.aget_history(prompt_id)
+    outputs = history.get(prompt_id, {}).get('outputs')
+    
+    if not outputs:
+        raise HTTPException(status_code=404, detail="No outputs available")
+    release_prompt_event(prompt_id)
+    
+    # Return the first video found
+    for node_id, node_outputs in outputs.items():
+        if 'videos' in node_outputs and node_outputs['videos']:
+            return node_outputs['videos'][0]
+    
+    raise HTTPException(status_code=404, detail="No video outputs found")
+
+async def stream_base64_data_url(video: Dict[str, Any]) -> AsyncIterator[bytes]:
+    """Stream a ComfyUI output file as a base64 data URL without buffering it"""
+    yield b"data:video/mp4;base64,"
+    
+    params = {
+        "filename": video['filename'],
+        "subfolder": video.get('subfolder', ''),
+        "type": video.get('type', 'output')
+    }
+    remainder = b""
+    async with async_http_client.stream("GET", "/view", params=params) as response:
+        response.raise_for_status()
+        async for chunk in response.aiter_bytes():
+            # Encode only whole 3-byte groups so no padding appears mid-stream
+            chunk = remainder + chunk
+            cut = len(chunk) - len(chunk) % 3
+            remainder = chunk[cut:]
+            yield base64.b64encode(chunk[:cut])
+    yield base64.b64encode(remainder)
+
+@app.get("/download/{job_id}")
+async def download_result(job_id: str, request: Request, inline: bool = False):
+    """Download job result
+    
+    Streams the file through from ComfyUI. When COMFYUI_PUBLIC_URL is set,
+    redirects to ComfyUI's /view instead so the file never passes through
+    this process, unless inline=true.
+    """
+    
+    try:
+        video = await find_job_video(job_id)
+        params = {
+            "filename": video['filename'],
+            "subfolder": video.get('subfolder', ''),
+            "type": video.get('type', 'output')
+        }
         
-        if not outputs:
-            raise HTTPException(status_code=404, detail="No outputs available")
+        if not inline and COMFYUI_PUBLIC_URL:
+            return RedirectResponse(url=f"{COMFYUI_PUBLIC_URL}/view?{urlencode(params)}", status_code=303)
         
-        # Return the first video found
-        for node_id, node_outputs in outputs.items():
-            if 'videos' in node_outputs and node_outputs['videos']:
-                video = node_outputs['videos'][0]
-                return {
-                    "job_id": job_id,
-                    "filename": video['filename'],
-                    "download_url": f"http://{COMFYUI_SERVER}/view?filename={video['filename']}&type=output"
-                }
+        # Forward Range so ComfyUI serves partial content for resumable downloads
+        upstream_headers = {}
+        if "range" in request.headers:
+            upstream_headers["Range"] = request.headers["range"]
+        
+        upstream = async_http_client.build_request("GET", "/view", params=params, headers=upstream_headers)
+        response = await async_http_client.send(upstream, stream=True)
+        if response.is_error:
+            await response.aclose()
+            response.raise_for_status()
         
-        raise HTTPException(status_code=404, detail="No video outputs found")
+        headers = {"Content-Disposition": f'attachment; filename="{video["filename"]}"'}
+        for name in ("content-length", "content-range", "accept-ranges", "last-modified", "etag"):
+            if name in response.headers:
+                headers[name] = response.headers[name]
+        
+        return StreamingResponse(
+            response.aiter_bytes(DOWNLOAD_CHUNK_SIZE),
+            status_code=response.status_code,
+            media_type=response.headers.get("content-type", "video/mp4"),
+            headers=headers,
+            background=BackgroundTask(response.aclose)
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error downloading result: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/download/{job_id}/base64")
+async def download_result_base64(job_id: str):
+    """Stream job result as a base64 data URL"""
+    
+    try:
+        video = await find_job_video(job_id)
+        return StreamingResponse(stream_base64_data_url(video), media_type="text/plain")
         
     except HTTPException:
         raise
@@ -334,40 +610,35 @@ async def download_result(job_id: str):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/workflow/info")
-async def get_workflow_info():
-    """Get information about the loaded workflow"""
+async def get_workflow_info(request: Request):
+    """Get information about the loaded workflow, answering revalidations with 304"""
+    workflow_manager.refresh()
     if not workflow_manager.base_workflow:
         raise HTTPException(status_code=500, detail="No workflow loaded")
     
-    # Extract node information
-    nodes_info = {}
-    for node_id, node_data in workflow_manager.base_workflow.items():
-        nodes_info[node_id] = {
-            "class_type": node_data.get("class_type"),
-            "inputs": list(node_data.get("inputs", {}).keys()),
-            "title": node_data.get("_meta", {}).get("title", "")
-        }
-    
-    return {
-        "workflow_file": WORKFLOW_FILE,
-        "total_nodes": len(workflow_manager.base_workflow),
-        "nodes": nodes_info
-    }
+    body = workflow_manager.info_json()
+    headers = {"ETag": workflow_manager.info_etag(), "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=304, headers=headers)
+    return Response(body, media_type="application/json", headers=headers)
 
 @app.get("/jobs")
-async def list_jobs():
-    """List all jobs"""
-    return {
+async def list_jobs(offset: int = Query(0, ge=0), limit: int = Query(100, ge=1, le=500)):
+    """List jobs, one page at a time"""
+    page = itertools.islice(active_jobs.items(), offset, offset + limit)
+    return ORJSONResponse({
         "total": len(active_jobs),
+        "offset": offset,
+        "limit": limit,
         "jobs": [
             {
                 "job_id": job_id,
                 "prompt_id": job_info["prompt_id"],
                 "status": job_info["status"]
             }
-            for job_id, job_info in active_jobs.items()
+            for job_id, job_info in page
         ]
-    }
+    })
 
 if __name__ == "__main__":
     import uvicorn
@@ -384,5 +655,8 @@ if __name__ == "__main__":
         host="0.0.0.0",
         port=port,
         reload=False,
+        # A single worker: jobs and completion waiters live in process memory
+        loop="uvloop",
+        http="httptools",
         log_level="info"
     )
\ No newline at end of file
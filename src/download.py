@@ -1,8 +1,17 @@
 #!/usr/bin/env python3
 import requests
 import argparse
+import json
 import os
+import re
+import shutil
 import sys
+import time
+from pathlib import Path
+
+# Model metadata cache, keyed by model ID
+METADATA_CACHE_DIR = Path("/tmp/civitai_meta")
+METADATA_CACHE_TTL = 24 * 60 * 60  # seconds
 
 # Parse arguments
 parser = argparse.ArgumentParser()
@@ -20,16 +29,40 @@ if not token:
 # URL of the file to download
 url = f"https://civitai.com/api/v1/model-versions/{args.model}"
 
-# Perform the request
-response = requests.get(url, stream=True)
-if response.status_code == 200:
-    data = response.json()
+# Use cached metadata when fresh, otherwise perform the request
+data = None
+cache_file = METADATA_CACHE_DIR / f"{args.model}.json"
+if cache_file.exists() and time.time() - cache_file.stat().st_mtime < METADATA_CACHE_TTL:
+    data = json.loads(cache_file.read_text())
+else:
+    response = requests.get(url)
+    if response.status_code == 200:
+        data = response.json()
+        METADATA_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        cache_file.write_text(json.dumps(data))
+
+if data is not None:
     filename = data['files'][0]['name']
     download_url = data['files'][0]['downloadUrl']
 
-    # Use wget with the resolved token
-    os.system(
-        f'wget "https://civitai.com/api/download/models/{args.model}?type=Model&format=SafeTensor&token={token}" --content-disposition')
+    # Stream the model straight to disk with the resolved token
+    with requests.get(
+            f"https://civitai.com/api/download/models/{args.model}",
+            params={"type": "Model", "format": "SafeTensor", "token": token},
+            stream=True) as download:
+        download.raise_for_status()
+
+        # Honour Content-Disposition like wget --content-disposition
+        disposition = download.headers.get("content-disposition", "")
+        match = re.search(r'filename="?([^";]+)"?', disposition)
+        if match:
+            filename = os.path.basename(match.group(1))
+
+        download.raw.decode_content = True
+        with open(filename, "wb") as f:
+            shutil.copyfileobj(download.raw, f, length=1 << 20)
+
+    print(f"Downloaded {filename}")
 else:
     print("Error: Failed to retrieve model metadata.")
     sys.exit(1)
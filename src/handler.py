@@ -4,89 +4,211 @@ RunPod Serverless Handler for ComfyUI Wan Video Generation
 Wrapper-SelfForcing-ImageToVideo-60FPS workflow implementation
 """
 
+import atexit
 import os
-import json
 import uuid
-import base64
-import tempfile
+import binascii
+import errno
+import functools
+import hashlib
+import mmap
+import queue
+import random
+import re
+import shutil
+import socket
 import traceback
 import subprocess
+import tempfile
+import threading
 import time
-from typing import Dict, Any, List
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional
 from urllib.parse import urlparse
-from urllib.request import urlopen, Request
 import logging
+from logging.handlers import QueueHandler, QueueListener
 
+import boto3
+import msgspec
+import orjson
+import requests
 import runpod
-from runpod.serverless.utils import download_files_from_urls, upload_file_to_bucket
+import websocket
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config as BotoConfig
+from requests.adapters import HTTPAdapter
+from runpod.serverless.utils.rp_upload import extract_region_from_url
+from urllib3.util.retry import Retry
+
+# SIMD-accelerated base64 when available, stdlib otherwise
+try:
+    import pybase64 as base64
+except ImportError:
+    import base64
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# Configure logging; records are queued and written by a background listener
+log_queue = queue.SimpleQueue()
+logging.basicConfig(level=logging.INFO, handlers=[QueueHandler(log_queue)])
+log_listener = QueueListener(log_queue, logging.StreamHandler())
+log_listener.start()
+atexit.register(log_listener.stop)
 logger = logging.getLogger(__name__)
 
+# Base64 data-URL image header, e.g. "data:image/png;base64,"; matching stops at the comma
+DATA_URL_RE = re.compile(r'data:image/[^;,]+;base64,')
+
+# Input image download limits
+MAX_IMAGE_BYTES = 50 * 1024 * 1024
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Base64 encode chunk size; a multiple of 3 so no padding appears mid-stream
+BASE64_CHUNK_SIZE = 3 * 1024 * 1024
+
+# Base64 decode chunk size; a multiple of 4 so each slice decodes on its own
+BASE64_DECODE_CHUNK_SIZE = 64 * 1024
+
+# Result uploads stream to S3 in 8 MiB parts, several in flight at once
+S3_TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=8 * 1024 * 1024,
+    multipart_chunksize=8 * 1024 * 1024,
+    max_concurrency=8,
+    use_threads=True
+)
+S3_PRESIGNED_URL_EXPIRY = 7 * 24 * 60 * 60  # seconds
+
 # ComfyUI API endpoint
+COMFYUI_HOST = "127.0.0.1"
+COMFYUI_PORT = 8188
 COMFYUI_API_URL = "http://127.0.0.1:8188"
+COMFYUI_WS_URL = "ws://127.0.0.1:8188/ws"
+COMFYUI_INPUT_DIR = "/workspace/ComfyUI/input"
+INPUT_STAGING_DIR = "/workspace/.input_staging"  # Same volume as ComfyUI, so moves are renames
+HISTORY_FETCH_WORKERS = 4
+CLIENT_ID = str(uuid.uuid4())
+
+# Keep-alive session for job calls to ComfyUI, retrying transient failures
+comfyui_session = requests.Session()
+comfyui_session.mount("http://", HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=8,
+    max_retries=Retry(total=3, backoff_factor=0.2, status_forcelist=[502, 503, 504])
+))
+
+# Cached WebSocket connection to ComfyUI, reused across jobs
+_comfyui_ws = None
+COMFYUI_WS_TIMEOUT = 30 * 60  # seconds without a message before a job is abandoned
+
+class JobInput(msgspec.Struct, kw_only=True):
+    """Job input parameters, validated and coerced from the raw job input"""
+    image: str
+    positive_prompt: str = "A beautiful woman walking towards the camera"
+    negative_prompt: str = "色调艳丽，过曝，静态，细节模糊不清，字幕，风格，作品，画作，画面，静止，整体发灰，最差质量，低质量，JPEG压缩残留，丑陋的，残缺的，多余的手指，画得不好的手部，画得不好的脸部，畸形的，毁容的，形态畸形的肢体，手指融合，静止不动的画面，杂乱的背景，三条腿，背景人很多，倒着走"
+    width: int = 720
+    height: int = 1280
+    num_frames: int = 81
+    steps: int = 5
+    cfg_scale: float = 1.0
+    cfg_img: float = 8.0
+    seed: Optional[int] = None  # Will be randomized if None
+    lora_strength: float = 0.7
+    frame_rate: int = 16
+    interpolation_multiplier: int = 5
+    final_frame_rate: int = 60
 
 def validate_input(job_input: Dict[str, Any]) -> Dict[str, Any]:
     """Validate and set default values for input parameters"""
     
-    # Required parameters
-    if 'image' not in job_input:
-        return {"error": "Missing required parameter: 'image'"}
-    
-    # Set defaults for optional parameters
-    defaults = {
-        "positive_prompt": "A beautiful woman walking towards the camera",
-        "negative_prompt": "色调艳丽，过曝，静态，细节模糊不清，字幕，风格，作品，画作，画面，静止，整体发灰，最差质量，低质量，JPEG压缩残留，丑陋的，残缺的，多余的手指，画得不好的手部，画得不好的脸部，畸形的，毁容的，形态畸形的肢体，手指融合，静止不动的画面，杂乱的背景，三条腿，背景人很多，倒着走",
-        "width": 720,
-        "height": 1280,
-        "num_frames": 81,
-        "steps": 5,
-        "cfg_scale": 1.0,
-        "cfg_img": 8.0,
-        "seed": None,  # Will be randomized if None
-        "lora_strength": 0.7,
-        "frame_rate": 16,
-        "interpolation_multiplier": 5,
-        "final_frame_rate": 60
-    }
+    # Check required parameters and types, coercing numeric strings
+    try:
+        validated_input = msgspec.convert(job_input, JobInput, strict=False)
+    except msgspec.ValidationError as e:
+        return {"error": f"Invalid input: {e}"}
     
-    # Apply defaults
-    for key, default_value in defaults.items():
-        job_input[key] = job_input.get(key, default_value)
+    # Only remote images and base64 data URLs can be loaded
+    if not (validated_input.image.startswith(('http://', 'https://'))
+            or DATA_URL_RE.match(validated_input.image)):
+        return {"error": "Invalid input: image must be an http(s) URL or a base64 data URL"}
     
     # Validate dimensions (must be multiples of 8 for VAE)
-    if job_input["width"] % 8 != 0 or job_input["height"] % 8 != 0:
+    if (validated_input.width | validated_input.height) & 7:
         return {"error": "Width and height must be multiples of 8"}
     
     # Validate frame count (must be odd number for proper video generation)
-    if job_input["num_frames"] % 2 == 0:
-        job_input["num_frames"] += 1
+    validated_input.num_frames |= 1
     
-    return {"validated_input": job_input}
+    return {"validated_input": validated_input}
 
-def download_image(image_input: str, job_id: str) -> str:
-    """Download image from URL or decode base64"""
+def decode_base64_to_file(data: str, start: int, dest_dir: str) -> str:
+    """Decode base64 text from start into dest_dir in chunks
+    
+    Files are named by the SHA-256 of the encoded payload, so a repeated
+    payload is recognised before decoding and never written twice.
+    """
+    
+    digest = hashlib.sha256()
+    for i in range(start, len(data), BASE64_DECODE_CHUNK_SIZE):
+        digest.update(data[i:i + BASE64_DECODE_CHUNK_SIZE].encode())
+    
+    image_path = os.path.join(dest_dir, f"{digest.hexdigest()}.png")
+    if os.path.exists(image_path):
+        logger.info(f"Reusing identical input image {image_path}")
+        return image_path
+    
+    temp_path = os.path.join(dest_dir, f".{uuid.uuid4().hex}.part")
+    try:
+        with open(temp_path, 'wb') as f:
+            try:
+                for i in range(start, len(data), BASE64_DECODE_CHUNK_SIZE):
+                    f.write(base64.b64decode(data[i:i + BASE64_DECODE_CHUNK_SIZE], validate=True))
+            except binascii.Error:
+                # Whitespace breaks chunk alignment; decode in one go
+                f.seek(0)
+                f.truncate()
+                f.write(base64.b64decode(data[start:]))
+        
+        os.replace(temp_path, image_path)
+        return image_path
+    
+    except Exception:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+
+def download_image(image_input: str, job_id: str, dest_dir: str) -> str:
+    """Download image from URL or decode base64 directly into dest_dir"""
     
     try:
         # Check if it's a URL
         if image_input.startswith(('http://', 'https://')):
-            downloaded_files = download_files_from_urls(job_id, [image_input])
-            if downloaded_files and downloaded_files[0]:
-                return downloaded_files[0]
-            else:
-                raise ValueError("Failed to download image from URL")
+            extension = os.path.splitext(urlparse(image_input).path)[1] or '.png'
+            temp_path = os.path.join(dest_dir, f".{job_id}_{uuid.uuid4().hex}.part")
+            
+            # Stream the body straight to disk in chunks, enforcing the size limit
+            # and hashing as we go so identical content shares one file
+            digest = hashlib.sha256()
+            try:
+                with requests.get(image_input, stream=True, timeout=30) as response:
+                    response.raise_for_status()
+                    with open(temp_path, 'wb') as image_file:
+                        for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                            image_file.write(chunk)
+                            digest.update(chunk)
+                            if image_file.tell() > MAX_IMAGE_BYTES:
+                                raise ValueError(f"Image exceeds {MAX_IMAGE_BYTES} bytes")
+                
+                image_path = os.path.join(dest_dir, f"{digest.hexdigest()}{extension}")
+                os.replace(temp_path, image_path)
+            except Exception:
+                if os.path.exists(temp_path):
+                    os.unlink(temp_path)
+                raise
+            return image_path
         
         # Check if it's base64 encoded
-        elif image_input.startswith('data:image/'):
-            # Extract base64 data
-            header, encoded = image_input.split(',', 1)
-            image_data = base64.b64decode(encoded)
-            
-            # Save to temporary file
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.png') as temp_file:
-                temp_file.write(image_data)
-                return temp_file.name
+        elif (data_url := DATA_URL_RE.match(image_input)):
+            # Decode the payload after the header under a payload-hash name
+            return decode_base64_to_file(image_input, data_url.end(), dest_dir)
         
         else:
             raise ValueError("Image must be a URL or base64 encoded data")
@@ -95,117 +217,413 @@ def download_image(image_input: str, job_id: str) -> str:
         logger.error(f"Error processing image: {str(e)}")
         raise
 
-def prepare_workflow(validated_input: Dict[str, Any], image_path: str) -> Dict[str, Any]:
+@functools.lru_cache(maxsize=None)
+def load_workflow_template(workflow_path: str) -> Dict[str, Any]:
+    """Read and parse a workflow JSON file once; the result is shared and must not be mutated"""
+    with open(workflow_path, 'rb') as f:
+        template = orjson.loads(f.read())
+    logger.info(f"Loaded workflow template from {workflow_path}")
+    return template
+
+# Workflow template, resolved once; falls back to the local path when running locally
+WORKFLOW_PATH = "/workflows/Wrapper-SelfForcing-ImageToVideo-60FPS.json"
+if not os.path.exists(WORKFLOW_PATH):
+    WORKFLOW_PATH = "./workflows/Wrapper-SelfForcing-ImageToVideo-60FPS.json"
+
+# Text found in the default negative prompt, used to tell it apart from the positive one
+NEGATIVE_PROMPT_MARKER = "色调艳丽"
+
+# Roles of nodes identified by type alone
+NODE_TYPE_ROLES = {
+    "WanVideoImageClipEncode": "image_encode",
+    "WanVideoSampler": "sampler",
+    "RIFE VFI": "interpolation",
+}
+
+# Roles of the VHS_VideoCombine nodes, by node id
+VIDEO_COMBINE_ROLES = {
+    80: "first_pass_video",
+    94: "final_video",
+}
+
+def match_node_role(node: Dict[str, Any]) -> Optional[str]:
+    """Return the job parameter role a workflow node plays, or None"""
+    node_type = node.get("type")
+    
+    role = NODE_TYPE_ROLES.get(node_type)
+    if role is not None:
+        return role
+    
+    title = node.get("title") or ""
+    if node_type == "Text Prompt (JPS)":
+        # Negative prompt identified by title or Chinese characters in default text
+        widgets = node.get("widgets_values") or ()
+        if title == "Negative Prompt" or any(
+                isinstance(value, str) and NEGATIVE_PROMPT_MARKER in value for value in widgets):
+            return "negative_prompt"
+        return "positive_prompt"
+    if node_type == "LoadImage" and title == "Input Image":
+        return "input_image"
+    if node_type == "WanVideoLoraSelect" and "Self Forcing" in title:
+        return "lora"
+    if node_type == "VHS_VideoCombine":
+        return VIDEO_COMBINE_ROLES.get(node.get("id"))
+    return None
+
+@functools.lru_cache(maxsize=None)
+def load_workflow_node_index(workflow_path: str) -> Dict[str, int]:
+    """Map each parameter role to the position of its node in the template node list"""
+    index = {}
+    for position, node in enumerate(load_workflow_template(workflow_path)["nodes"]):
+        role = match_node_role(node)
+        if role is not None and role not in index:
+            index[role] = position
+            # Stop scanning once every role has been bound
+            if len(index) == len(ROLE_SETTERS):
+                break
+    return index
+
+# Per-role setters that write job parameters into a copied workflow node
+
+def set_positive_prompt(node: Dict[str, Any], validated_input: JobInput, image_path: str) -> None:
+    node["widgets_values"] = [validated_input.positive_prompt]
+
+def set_negative_prompt(node: Dict[str, Any], validated_input: JobInput, image_path: str) -> None:
+    node["widgets_values"] = [validated_input.negative_prompt]
+
+def set_input_image(node: Dict[str, Any], validated_input: JobInput, image_path: str) -> None:
+    # ComfyUI resolves the bare filename against its input directory
+    node["widgets_values"] = [os.path.basename(image_path), "image"]
+
+def set_image_encode(node: Dict[str, Any], validated_input: JobInput, image_path: str) -> None:
+    widgets = node["widgets_values"]
+    widgets[0] = validated_input.height      # height
+    widgets[1] = validated_input.width       # width
+    widgets[2] = validated_input.num_frames  # frames
+
+def set_sampler(node: Dict[str, Any], validated_input: JobInput, image_path: str) -> None:
+    widgets = node["widgets_values"]
+    widgets[0] = validated_input.steps      # steps
+    widgets[1] = validated_input.cfg_scale  # cfg
+    widgets[2] = validated_input.cfg_img    # cfg_img
+    if validated_input.seed is not None:
+        widgets[3] = validated_input.seed   # seed
+        widgets[4] = "fixed"                # seed control
+
+def set_lora(node: Dict[str, Any], validated_input: JobInput, image_path: str) -> None:
+    # Self Forcing LoRA strength
+    node["widgets_values"][1] = validated_input.lora_strength
+
+def set_first_pass_video(node: Dict[str, Any], validated_input: JobInput, image_path: str) -> None:
+    node["widgets_values"]["frame_rate"] = validated_input.frame_rate
+
+def set_interpolation(node: Dict[str, Any], validated_input: JobInput, image_path: str) -> None:
+    # RIFE interpolation multiplier
+    node["widgets_values"][1] = validated_input.interpolation_multiplier
+
+def set_final_video(node: Dict[str, Any], validated_input: JobInput, image_path: str) -> None:
+    node["widgets_values"]["frame_rate"] = validated_input.final_frame_rate
+
+ROLE_SETTERS = {
+    "positive_prompt": set_positive_prompt,
+    "negative_prompt": set_negative_prompt,
+    "input_image": set_input_image,
+    "image_encode": set_image_encode,
+    "sampler": set_sampler,
+    "lora": set_lora,
+    "first_pass_video": set_first_pass_video,
+    "interpolation": set_interpolation,
+    "final_video": set_final_video,
+}
+
+# Job parameters the numeric roles' nodes depend on. Their prepared nodes are
+# cached per parameter combination and shared, unmodified, between jobs.
+ROLE_PARAMS = {
+    "image_encode": ("height", "width", "num_frames"),
+    "sampler": ("steps", "cfg_scale", "cfg_img", "seed"),
+    "lora": ("lora_strength",),
+    "first_pass_video": ("frame_rate",),
+    "interpolation": ("interpolation_multiplier",),
+    "final_video": ("final_frame_rate",),
+}
+PARAM_NODE_CACHE_SIZE = 256
+_param_nodes: Dict[tuple, Dict[str, Any]] = {}
+
+def prepare_workflow(validated_input: JobInput, image_path: str) -> Dict[str, Any]:
     """Prepare ComfyUI workflow with input parameters"""
     
     # Load the base workflow
-    workflow_path = "/workflows/Wrapper-SelfForcing-ImageToVideo-60FPS.json"
-    if not os.path.exists(workflow_path):
-        # Fallback to local path if running locally
-        workflow_path = "./workflows/Wrapper-SelfForcing-ImageToVideo-60FPS.json"
-    
-    with open(workflow_path, 'r') as f:
-        workflow = json.load(f)
+    template = load_workflow_template(WORKFLOW_PATH)
     
-    # Update workflow parameters based on input
-    for node in workflow["nodes"]:
-        node_type = node.get("type")
-        
-        # Update positive prompt
-        if node_type == "Text Prompt (JPS)" and node.get("title") != "Negative Prompt":
-            node["widgets_values"] = [validated_input["positive_prompt"]]
-        
-        # Update negative prompt (identified by Chinese characters in default)
-        elif node_type == "Text Prompt (JPS)" and "色调艳丽" in str(node.get("widgets_values", [])):
-            node["widgets_values"] = [validated_input["negative_prompt"]]
-        
-        # Update image input
-        elif node_type == "LoadImage" and node.get("title") == "Input Image":
-            # Extract filename from path
-            filename = os.path.basename(image_path)
-            node["widgets_values"] = [filename, "image"]
+    # Share untouched nodes with the cached template; only role nodes are copied
+    # (orjson round-trips are several times faster than copy.deepcopy for JSON data)
+    nodes = list(template["nodes"])
+    for role, position in load_workflow_node_index(WORKFLOW_PATH).items():
+        params = ROLE_PARAMS.get(role)
+        if params is None:
+            # Prompt and image nodes change with nearly every job
+            nodes[position] = node = orjson.loads(orjson.dumps(nodes[position]))
+            ROLE_SETTERS[role](node, validated_input, image_path)
+            continue
         
-        # Update video dimensions and length
-        elif node_type == "WanVideoImageClipEncode":
-            node["widgets_values"][0] = validated_input["height"]  # height
-            node["widgets_values"][1] = validated_input["width"]   # width
-            node["widgets_values"][2] = validated_input["num_frames"]  # frames
-        
-        # Update sampling parameters
-        elif node_type == "WanVideoSampler":
-            widgets = node["widgets_values"]
-            widgets[0] = validated_input["steps"]      # steps
-            widgets[1] = validated_input["cfg_scale"]  # cfg
-            widgets[2] = validated_input["cfg_img"]    # cfg_img
-            if validated_input["seed"] is not None:
-                widgets[3] = validated_input["seed"]   # seed
-                widgets[4] = "fixed"                   # seed control
+        key = (role, *(getattr(validated_input, name) for name in params))
+        node = _param_nodes.get(key)
+        if node is None:
+            node = orjson.loads(orjson.dumps(nodes[position]))
+            ROLE_SETTERS[role](node, validated_input, image_path)
+            if len(_param_nodes) >= PARAM_NODE_CACHE_SIZE:
+                _param_nodes.clear()
+            _param_nodes[key] = node
+        nodes[position] = node
+    
+    return {**template, "nodes": nodes}
+
+def get_comfyui_websocket() -> websocket.WebSocket:
+    """Return a connected ComfyUI WebSocket, reusing the cached connection"""
+    global _comfyui_ws
+    
+    if _comfyui_ws is None or not _comfyui_ws.connected:
+        _comfyui_ws = websocket.WebSocket()
+        _comfyui_ws.connect(f"{COMFYUI_WS_URL}?clientId={CLIENT_ID}", timeout=COMFYUI_WS_TIMEOUT)
+        logger.info(f"Connected to ComfyUI WebSocket with client_id: {CLIENT_ID}")
+    return _comfyui_ws
+
+def close_comfyui_websocket() -> None:
+    """Close and forget the cached ComfyUI WebSocket so the next job reconnects"""
+    global _comfyui_ws
+    
+    if _comfyui_ws is not None:
+        try:
+            _comfyui_ws.close()
+        except websocket.WebSocketException:
+            pass
+        _comfyui_ws = None
+
+def wait_for_prompts(ws: websocket.WebSocket, prompt_ids: List[str]) -> Dict[str, Optional[str]]:
+    """Block until ComfyUI reports every prompt has finished executing
+    
+    Returns each prompt's execution error message, or None if it succeeded.
+    """
+    
+    pending = set(prompt_ids)
+    errors = {}
+    while pending:
+        out = ws.recv()
+        if not isinstance(out, str):
+            continue  # Skip binary preview frames
         
-        # Update LoRA strength (Self Forcing LoRA)
-        elif node_type == "WanVideoLoraSelect" and "Self Forcing" in node.get("title", ""):
-            node["widgets_values"][1] = validated_input["lora_strength"]
+        message = orjson.loads(out)
+        data = message.get("data", {})
+        prompt_id = data.get("prompt_id")
+        if prompt_id not in pending:
+            continue
         
-        # Update frame rate for first pass
-        elif node_type == "VHS_VideoCombine" and node.get("id") == 80:
-            node["widgets_values"]["frame_rate"] = validated_input["frame_rate"]
+        if message["type"] == "execution_success" or (
+                message["type"] == "executing" and data.get("node") is None):
+            errors[prompt_id] = None
+            pending.discard(prompt_id)
+        elif message["type"] == "execution_error":
+            errors[prompt_id] = data.get('exception_message', 'Unknown error')
+            pending.discard(prompt_id)
+        elif message["type"] == "execution_interrupted":
+            errors[prompt_id] = f"Execution interrupted at node {data.get('node_id')}"
+            pending.discard(prompt_id)
+    return errors
+
+def poll_for_prompts(prompt_ids: List[str]) -> Dict[str, Optional[str]]:
+    """Poll ComfyUI's history until every prompt has finished, for when the WebSocket is unavailable
+    
+    Returns each prompt's execution error message, or None if it succeeded.
+    """
+    
+    pending = set(prompt_ids)
+    errors = {}
+    deadline = time.monotonic() + COMFYUI_WS_TIMEOUT
+    delay = 0.25
+    
+    while True:
+        for prompt_id in list(pending):
+            history_response = comfyui_session.get(f"{COMFYUI_API_URL}/history/{prompt_id}")
+            history_response.raise_for_status()
+            
+            # Prompts only appear in the history once they have finished
+            execution = orjson.loads(history_response.content).get(prompt_id)
+            if execution is None:
+                continue
+            
+            errors[prompt_id] = None
+            status = execution.get("status", {})
+            if status.get("status_str") == "error":
+                errors[prompt_id] = next(
+                    (data.get("exception_message", "Unknown error")
+                     for kind, data in status.get("messages", []) if kind == "execution_error"),
+                    "Unknown error")
+            pending.discard(prompt_id)
         
-        # Update RIFE interpolation
-        elif node_type == "RIFE VFI":
-            node["widgets_values"][1] = validated_input["interpolation_multiplier"]
+        if not pending:
+            return errors
+        if time.monotonic() >= deadline:
+            raise TimeoutError(f"Timed out waiting for prompts {sorted(pending)}")
         
-        # Update final frame rate
-        elif node_type == "VHS_VideoCombine" and node.get("id") == 94:
-            node["widgets_values"]["frame_rate"] = validated_input["final_frame_rate"]
+        # Jittered exponential backoff keeps concurrent pollers from synchronising
+        time.sleep(delay * random.uniform(0.5, 1.0))
+        delay = min(delay * 2, 2.0)
+
+def get_prompt_video(prompt_id: str) -> str:
+    """Fetch a finished prompt's history and return its output video path"""
+    
+    history_response = comfyui_session.get(f"{COMFYUI_API_URL}/history/{prompt_id}")
+    history_response.raise_for_status()
     
-    return workflow
+    execution = orjson.loads(history_response.content).get(prompt_id, {})
+    
+    # Find the final video output
+    for node_id, node_output in execution.get("outputs", {}).items():
+        if "filenames" in node_output:
+            filenames = node_output["filenames"]
+            if filenames:
+                video_info = filenames[0]
+                video_path = os.path.join("/workspace/ComfyUI/output", 
+                                        video_info.get("subfolder", ""), 
+                                        video_info["filename"])
+                logger.info(f"Video generated: {video_path}")
+                return video_path
+    
+    # If no video found, check for errors
+    if "status" in execution and execution["status"].get("completed") == False:
+        error_msg = execution.get("status", {}).get("messages", ["Unknown error"])
+        raise RuntimeError(f"ComfyUI execution failed: {error_msg}")
+    raise RuntimeError(f"No video output found for prompt {prompt_id}")
 
-def execute_comfyui_workflow(workflow: Dict[str, Any]) -> str:
-    """Execute workflow on ComfyUI and return output video path"""
+def execute_comfyui_workflows(workflows: List[Dict[str, Any]]) -> List[Any]:
+    """Execute workflows on ComfyUI as one batch
     
-    import requests
-    import time
+    All prompts are queued back to back and awaited on the shared WebSocket.
+    Returns, per workflow, its output video path or the exception it failed with.
+    """
     
     try:
-        # Submit workflow to ComfyUI
-        response = requests.post(f"{COMFYUI_API_URL}/prompt", json={"prompt": workflow})
-        response.raise_for_status()
+        # Subscribe before submitting so no completion event can be missed
+        try:
+            ws = get_comfyui_websocket()
+        except (websocket.WebSocketException, OSError) as e:
+            logger.warning(f"ComfyUI WebSocket unavailable ({e}), polling history instead")
+            ws = None
         
-        prompt_id = response.json()["prompt_id"]
-        logger.info(f"Submitted workflow with prompt_id: {prompt_id}")
+        # Submit workflows to ComfyUI; a rejected workflow fails alone, as its result
+        results: List[Any] = []
+        for workflow in workflows:
+            try:
+                response = comfyui_session.post(
+                    f"{COMFYUI_API_URL}/prompt",
+                    data=orjson.dumps({"prompt": workflow, "client_id": CLIENT_ID}),
+                    headers={"Content-Type": "application/json"}
+                )
+                response.raise_for_status()
+                results.append(orjson.loads(response.content)["prompt_id"])
+            except Exception as e:
+                logger.error(f"Error submitting workflow to ComfyUI: {str(e)}")
+                results.append(e)
+        prompt_ids = [result for result in results if isinstance(result, str)]
+        logger.info(f"Submitted workflows with prompt_ids: {prompt_ids}")
+        if not prompt_ids:
+            return results
         
-        # Poll for completion
-        while True:
-            time.sleep(2)
-            history_response = requests.get(f"{COMFYUI_API_URL}/history/{prompt_id}")
-            history_response.raise_for_status()
-            
-            history = history_response.json()
-            if prompt_id in history:
-                execution = history[prompt_id]
-                if "outputs" in execution:
-                    # Find the final video output
-                    for node_id, node_output in execution["outputs"].items():
-                        if "filenames" in node_output:
-                            filenames = node_output["filenames"]
-                            if filenames:
-                                video_info = filenames[0]
-                                video_path = os.path.join("/workspace/ComfyUI/output", 
-                                                        video_info.get("subfolder", ""), 
-                                                        video_info["filename"])
-                                logger.info(f"Video generated: {video_path}")
-                                return video_path
-                    
-                    # If no video found, check for errors
-                    if "status" in execution and execution["status"].get("completed") == False:
-                        error_msg = execution.get("status", {}).get("messages", ["Unknown error"])
-                        raise RuntimeError(f"ComfyUI execution failed: {error_msg}")
-            
-            time.sleep(3)
+        # Wait for the terminal executing events, then resolve outputs once each
+        errors = None
+        if ws is not None:
+            try:
+                errors = wait_for_prompts(ws, prompt_ids)
+            except (websocket.WebSocketException, OSError) as e:
+                # Never reuse a socket that failed or stalled mid-job
+                logger.warning(f"ComfyUI WebSocket failed ({e}), polling history instead")
+                close_comfyui_websocket()
+        if errors is None:
+            errors = poll_for_prompts(prompt_ids)
+        
+        def resolve(prompt_id: Any) -> Any:
+            if isinstance(prompt_id, Exception):
+                return prompt_id
+            if errors[prompt_id] is not None:
+                return RuntimeError(f"ComfyUI execution failed: {errors[prompt_id]}")
+            try:
+                return get_prompt_video(prompt_id)
+            except Exception as e:
+                return e
+        
+        if len(prompt_ids) == 1:
+            return [resolve(result) for result in results]
+        with ThreadPoolExecutor(max_workers=HISTORY_FETCH_WORKERS) as executor:
+            return list(executor.map(resolve, results))
     
     except Exception as e:
         logger.error(f"Error executing ComfyUI workflow: {str(e)}")
         raise
 
+def execute_comfyui_workflow(workflow: Dict[str, Any]) -> str:
+    """Execute workflow on ComfyUI and return output video path"""
+    
+    result = execute_comfyui_workflows([workflow])[0]
+    if isinstance(result, Exception):
+        logger.error(f"Error executing ComfyUI workflow: {str(result)}")
+        raise result
+    return result
+
+def encode_file_base64(file_path: str, prefix: str = "") -> str:
+    """Base64 encode a file in chunks over a read-only mmap
+    
+    Chunks are encoded into one buffer sized for the whole result, after an
+    optional prefix such as a data-URL header, so the output is only copied
+    once more when it is decoded to str.
+    """
+    
+    header = prefix.encode('ascii')
+    with open(file_path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return prefix
+        encoded = bytearray(len(header) + 4 * ((size + 2) // 3))
+        encoded[:len(header)] = header
+        position = len(header)
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for i in range(0, size, BASE64_CHUNK_SIZE):
+                chunk = base64.b64encode(mm[i:i + BASE64_CHUNK_SIZE])
+                encoded[position:position + len(chunk)] = chunk
+                position += len(chunk)
+    return encoded.decode('ascii')
+
+@functools.lru_cache(maxsize=None)
+def get_s3_client(endpoint_url: str, access_key_id: str, secret_access_key: str):
+    """Create an S3 client once per set of bucket credentials"""
+    return boto3.client(
+        's3',
+        endpoint_url=endpoint_url,
+        aws_access_key_id=access_key_id,
+        aws_secret_access_key=secret_access_key,
+        config=BotoConfig(signature_version='s3v4', retries={'max_attempts': 3, 'mode': 'standard'}),
+        region_name=extract_region_from_url(endpoint_url)
+    )
+
+def upload_file_to_bucket(file_name: str, file_path: str, bucket_creds: Dict[str, str]) -> str:
+    """Stream a file to the bucket as a multipart upload and return a presigned URL
+    
+    Uses the same region, bucket and key layout as RunPod's helper of the same name.
+    """
+    
+    client = get_s3_client(
+        bucket_creds['endpointUrl'], bucket_creds['accessId'], bucket_creds['accessSecret'])
+    bucket_name = time.strftime("%m-%y")
+    client.upload_file(
+        file_path, bucket_name, file_name,
+        ExtraArgs={'ContentType': 'video/mp4'},
+        Config=S3_TRANSFER_CONFIG
+    )
+    return client.generate_presigned_url(
+        'get_object',
+        Params={'Bucket': bucket_name, 'Key': file_name},
+        ExpiresIn=S3_PRESIGNED_URL_EXPIRY
+    )
+
 def upload_result(video_path: str) -> str:
     """Upload result video to bucket and return URL"""
     
@@ -226,15 +644,155 @@ def upload_result(video_path: str) -> str:
             return presigned_url
         else:
             # Return as base64 if no S3 configured
-            with open(video_path, 'rb') as video_file:
-                video_data = video_file.read()
-                video_base64 = base64.b64encode(video_data).decode('utf-8')
-                return f"data:video/mp4;base64,{video_base64}"
+            return encode_file_base64(video_path, prefix="data:video/mp4;base64,")
     
     except Exception as e:
         logger.error(f"Error uploading result: {str(e)}")
         raise
 
+def job_result(validated_input: JobInput, video_path: str) -> Dict[str, Any]:
+    """Upload a finished video and describe it for the job output"""
+    
+    # Upload result
+    video_url = upload_result(video_path)
+    
+    return {
+        "video_url": video_url,
+        "metadata": {
+            "width": validated_input.width,
+            "height": validated_input.height,
+            "num_frames": validated_input.num_frames,
+            "frame_rate": validated_input.final_frame_rate,
+            "duration": validated_input.num_frames / validated_input.final_frame_rate
+        }
+    }
+
+def handle_batch(job_id: str, batch: List[Any]) -> Dict[str, Any]:
+    """Generate a video per batch item, queuing all of them on ComfyUI at once
+    
+    Each item takes the same parameters as a single job. Items that fail
+    validation or execution get an error entry; the rest still run.
+    """
+    
+    results: List[Optional[Dict[str, Any]]] = [None] * len(batch)
+    queued = []  # (index, validated_input, workflow)
+    image_paths = {}  # Items reusing an image input share one download
+    
+    for index, item in enumerate(batch):
+        validation_result = validate_input(item if isinstance(item, dict) else {})
+        if "error" in validation_result:
+            results[index] = validation_result
+            continue
+        
+        validated_input = validation_result["validated_input"]
+        image_path = image_paths.get(validated_input.image)
+        if image_path is None:
+            try:
+                image_path = download_image(validated_input.image, f"{job_id}_{index}", COMFYUI_INPUT_DIR)
+            except Exception as e:
+                results[index] = {"error": f"Failed to process image: {str(e)}"}
+                continue
+            image_paths[validated_input.image] = image_path
+        queued.append((index, validated_input, prepare_workflow(validated_input, image_path)))
+    
+    if queued:
+        video_paths = execute_comfyui_workflows([workflow for _, _, workflow in queued])
+        for (index, validated_input, _), video_path in zip(queued, video_paths):
+            if isinstance(video_path, Exception):
+                results[index] = {"error": f"Failed to process video generation: {str(video_path)}"}
+            else:
+                try:
+                    results[index] = job_result(validated_input, video_path)
+                except Exception as e:
+                    results[index] = {"error": f"Failed to process video generation: {str(e)}"}
+    
+    return {"results": results}
+
+# Set once ComfyUI's input directory is known to exist
+_input_dir_ready = False
+
+# Returned when the ComfyUI server never came up
+COMFYUI_NOT_READY_ERROR = {
+    "error": "ComfyUI failed to initialize. Please try again later.",
+    "details": "The ComfyUI server did not become ready within the timeout period"
+}
+
+def ensure_comfyui_input_dir() -> None:
+    """Create ComfyUI's input directory once; only call once ComfyUI is installed"""
+    global _input_dir_ready
+    
+    if not _input_dir_ready:
+        os.makedirs(COMFYUI_INPUT_DIR, exist_ok=True)
+        _input_dir_ready = True
+
+def move_file(src: str, dst: str) -> None:
+    """Rename src to dst, copying in-kernel when they are on different filesystems"""
+    try:
+        os.replace(src, dst)
+        return
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+    
+    temp_path = f"{dst}.{uuid.uuid4().hex}.part"
+    try:
+        with open(src, 'rb') as fsrc, open(temp_path, 'wb') as fdst:
+            try:
+                # Zero-copy (or reflink) inside the kernel where supported
+                remaining = os.fstat(fsrc.fileno()).st_size
+                while remaining > 0:
+                    copied = os.copy_file_range(fsrc.fileno(), fdst.fileno(), remaining)
+                    if copied == 0:
+                        break
+                    remaining -= copied
+            except (AttributeError, OSError):
+                fsrc.seek(0)
+                fdst.seek(0)
+                fdst.truncate()
+                shutil.copyfileobj(fsrc, fdst, DOWNLOAD_CHUNK_SIZE)
+        os.replace(temp_path, dst)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+    os.unlink(src)
+
+def ready_input_image(image_input: str, job_id: str) -> Optional[str]:
+    """Ensure ComfyUI is ready and place the job image in its input directory
+    
+    On a cold worker the image downloads into a staging directory while
+    ComfyUI starts, then is moved into place: renamed when /workspace is a
+    network volume, copied from the temp directory otherwise. Returns None if
+    ComfyUI never became ready.
+    """
+    
+    logger.info("🔧 Checking ComfyUI readiness...")
+    if _comfyui_ready.is_set():
+        ensure_comfyui_input_dir()
+        return download_image(image_input, job_id, COMFYUI_INPUT_DIR)
+    
+    # The input directory cannot be created early: setup skips installing
+    # ComfyUI when /workspace/ComfyUI already exists. Nor can /workspace itself,
+    # which start.sh takes as the sign of a network volume
+    if os.path.isdir(os.path.dirname(INPUT_STAGING_DIR)):
+        staging_dir = INPUT_STAGING_DIR
+        os.makedirs(staging_dir, exist_ok=True)
+    else:
+        staging_dir = tempfile.gettempdir()
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        staged = executor.submit(download_image, image_input, job_id, staging_dir)
+        ready = ensure_comfyui_ready()
+        staged_path = staged.result()
+    
+    if not ready:
+        os.unlink(staged_path)
+        return None
+    
+    ensure_comfyui_input_dir()
+    image_path = os.path.join(COMFYUI_INPUT_DIR, os.path.basename(staged_path))
+    move_file(staged_path, image_path)
+    return image_path
+
 def handler(job: Dict[str, Any]) -> Dict[str, Any]:
     """Main handler function for RunPod serverless"""
     
@@ -242,16 +800,16 @@ def handler(job: Dict[str, Any]) -> Dict[str, Any]:
     job_input = job.get("input", {})
     
     try:
-        logger.info(f"🔥 Processing job {job_id} with input: {job_input}")
+        logger.info(f"🔥 Processing job {job_id} with input keys: {sorted(job_input)}")
         
-        # Ensure ComfyUI is ready before processing
-        logger.info("🔧 Checking ComfyUI readiness...")
-        if not ensure_comfyui_ready():
-            return {
-                "error": "ComfyUI failed to initialize. Please try again later.",
-                "details": "The ComfyUI server did not become ready within the timeout period"
-            }
-        logger.info("✅ ComfyUI ready, proceeding with job")
+        # Batch jobs share one ComfyUI queue submission and completion wait
+        batch = job_input.get("batch")
+        if isinstance(batch, list):
+            logger.info("🔧 Checking ComfyUI readiness...")
+            if not ensure_comfyui_ready():
+                return dict(COMFYUI_NOT_READY_ERROR)
+            ensure_comfyui_input_dir()
+            return handle_batch(job_id, batch)
         
         # Validate input
         validation_result = validate_input(job_input)
@@ -260,52 +818,80 @@ def handler(job: Dict[str, Any]) -> Dict[str, Any]:
         
         validated_input = validation_result["validated_input"]
         
-        # Download/process input image
-        image_path = download_image(validated_input["image"], job_id)
-        
-        # Copy image to ComfyUI input directory
-        import shutil
-        comfyui_input_dir = "/workspace/ComfyUI/input"
-        if not os.path.exists(comfyui_input_dir):
-            os.makedirs(comfyui_input_dir)
-        
-        final_image_path = os.path.join(comfyui_input_dir, os.path.basename(image_path))
-        shutil.copy2(image_path, final_image_path)
+        # Download/process input image straight into ComfyUI input directory,
+        # overlapping the download with ComfyUI start-up on a cold worker
+        image_path = ready_input_image(validated_input.image, job_id)
+        if image_path is None:
+            return dict(COMFYUI_NOT_READY_ERROR)
+        logger.info("✅ ComfyUI ready, proceeding with job")
         
         # Prepare workflow
-        workflow = prepare_workflow(validated_input, final_image_path)
+        workflow = prepare_workflow(validated_input, image_path)
         
         # Execute workflow
         video_path = execute_comfyui_workflow(workflow)
         
-        # Upload result
-        video_url = upload_result(video_path)
-        
-        # Clean up temporary files
-        if image_path.startswith('/tmp'):
-            os.unlink(image_path)
-        
-        return {
-            "video_url": video_url,
-            "metadata": {
-                "width": validated_input["width"],
-                "height": validated_input["height"],
-                "num_frames": validated_input["num_frames"],
-                "frame_rate": validated_input["final_frame_rate"],
-                "duration": validated_input["num_frames"] / validated_input["final_frame_rate"]
-            }
-        }
+        return job_result(validated_input, video_path)
         
     except Exception as e:
-        logger.error(f"Error processing job {job_id}: {str(e)}")
-        return {
-            "error": f"Failed to process video generation: {str(e)}",
-            "traceback": traceback.format_exc()
-        }
+        logger.exception(f"Error processing job {job_id}")
+        error = {"error": f"Failed to process video generation: {str(e)}"}
+        # The traceback is always logged; only include it in the output when debugging
+        if os.getenv("RUNPOD_DEBUG"):
+            error["traceback"] = traceback.format_exc()
+        return error
+
+def wait_for_comfyui_port(timeout: float) -> bool:
+    """Probe the ComfyUI port with exponential backoff until it accepts connections"""
+    deadline = time.monotonic() + timeout
+    delay = 0.05
+    
+    while True:
+        try:
+            socket.create_connection((COMFYUI_HOST, COMFYUI_PORT), timeout=0.25).close()
+            return True
+        except OSError:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            time.sleep(min(delay, remaining))
+            delay = min(delay * 1.5, 2.0)
+
+def start_comfyui_server(comfyui_path: str) -> subprocess.Popen:
+    """Launch the ComfyUI server in its own session so worker signals do not reach it
+    
+    A server this worker already launched is reused while it is still running.
+    """
+    global _comfyui_process
+    
+    if _comfyui_process is None or _comfyui_process.poll() is not None:
+        _comfyui_process = subprocess.Popen([
+            "python3", f"{comfyui_path}/main.py", 
+            "--listen", "--use-sage-attention"
+        ], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+    return _comfyui_process
+
+def comfyui_responding(timeout: float) -> bool:
+    """Return True if the ComfyUI API answers
+    
+    A 250 ms TCP connect is tried first so a server that is not listening yet
+    fails fast instead of costing a full HTTP timeout.
+    """
+    if not wait_for_comfyui_port(0):
+        return False
+    try:
+        return comfyui_session.get(f"{COMFYUI_API_URL}/system_stats", timeout=timeout).status_code == 200
+    except requests.exceptions.RequestException:
+        return False
+
+# Setup script output worth logging, and output meaning ComfyUI is serving
+SETUP_LOG_KEYWORDS = ('error', 'fail', 'downloading', 'installing', 'finished', 'ready')
+SETUP_READY_MARKERS = ('setup completed', 'comfyui is up')
 
 # ComfyUI setup state tracking
 _setup_started = False
-_comfyui_ready = False
+_comfyui_ready = threading.Event()
+_comfyui_process = None
 
 def setup_comfyui():
     """Setup ComfyUI asynchronously to avoid blocking worker initialization"""
@@ -314,12 +900,8 @@ def setup_comfyui():
     if _setup_started:
         return True
         
-    import subprocess
-    import threading
-    
     def run_setup():
         """Run setup in background thread"""
-        global _comfyui_ready
         try:
             logger.info("🚀 Starting ComfyUI setup in background...")
             
@@ -327,15 +909,11 @@ def setup_comfyui():
             comfyui_path = "/workspace/ComfyUI"
             if os.path.exists(comfyui_path):
                 logger.info("📁 ComfyUI directory found, checking if server is running...")
-                try:
-                    import requests
-                    response = requests.get(f"{COMFYUI_API_URL}/", timeout=3)
-                    if response.status_code == 200:
-                        logger.info("✅ ComfyUI server already running!")
-                        _comfyui_ready = True
-                        return
-                except:
-                    logger.info("⚠️ ComfyUI server not responding, will start setup")
+                if comfyui_responding(3):
+                    logger.info("✅ ComfyUI server already running!")
+                    _comfyui_ready.set()
+                    return
+                logger.info("⚠️ ComfyUI server not responding, will start setup")
             else:
                 logger.info("📁 ComfyUI directory not found, starting full setup...")
             
@@ -346,24 +924,33 @@ def setup_comfyui():
                                      stderr=subprocess.STDOUT,  # Merge stderr to stdout
                                      text=True,
                                      bufsize=1,  # Line buffered
-                                     universal_newlines=True)
+                                     universal_newlines=True,
+                                     start_new_session=True)  # Own process group
             
-            # Log output in real-time while process runs
-            setup_logs = []
-            for line in iter(process.stdout.readline, ''):
-                if line:
-                    line = line.rstrip()
-                    setup_logs.append(line)
-                    # Log important lines
-                    if any(keyword in line.lower() for keyword in ['error', 'fail', 'downloading', 'installing', 'finished', 'ready']):
-                        logger.info(f"📋 Setup: {line}")
-                    
-                    # Check if we've reached a good state
-                    if "setup completed" in line.lower() or "comfyui is up" in line.lower():
-                        break
+            # Log output in real-time while process runs, keeping only the tail
+            # for error reports. The script never exits once ComfyUI is up
+            # (it ends in `sleep infinity`), so readiness is signalled from its
+            # output and the pipe keeps being drained so the script cannot block.
+            setup_logs = deque(maxlen=10)
+            for line in process.stdout:
+                line = line.rstrip()
+                if not line:
+                    continue
+                setup_logs.append(line)
+                lowered = line.lower()
+                # Log important lines
+                if any(keyword in lowered for keyword in SETUP_LOG_KEYWORDS):
+                    logger.info(f"📋 Setup: {line}")
+                
+                # Check if we've reached a good state
+                if not _comfyui_ready.is_set() and any(marker in lowered for marker in SETUP_READY_MARKERS):
+                    logger.info("✅ ComfyUI server is ready!")
+                    _comfyui_ready.set()
             
             # Wait for process to complete
             return_code = process.wait()
+            if _comfyui_ready.is_set():
+                return
             
             if return_code == 0:
                 logger.info("✅ Setup script completed successfully")
@@ -371,58 +958,39 @@ def setup_comfyui():
                 
                 # Try to start ComfyUI if it's not already running
                 try:
-                    import requests
-                    # Wait a bit for any existing server to be ready
-                    time.sleep(5)
-                    
-                    # Check if server is running
-                    try:
-                        response = requests.get(f"{COMFYUI_API_URL}/", timeout=3)
-                        if response.status_code == 200:
-                            logger.info("✅ ComfyUI server is ready!")
-                            _comfyui_ready = True
-                            return
-                    except:
-                        pass
+                    # Give any server started by the script a moment to come up
+                    if wait_for_comfyui_port(5) and comfyui_responding(3):
+                        logger.info("✅ ComfyUI server is ready!")
+                        _comfyui_ready.set()
+                        return
                     
                     # If not running, start it
                     logger.info("🚀 Starting ComfyUI server...")
-                    server_process = subprocess.Popen([
-                        "python3", f"{comfyui_path}/main.py", 
-                        "--listen", "--use-sage-attention"
-                    ], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                    start_comfyui_server(comfyui_path)
                     
-                    # Wait for server to be ready
-                    for i in range(60):  # Wait up to 2 minutes
-                        try:
-                            response = requests.get(f"{COMFYUI_API_URL}/", timeout=5)
-                            if response.status_code == 200:
-                                logger.info("✅ ComfyUI server is ready!")
-                                _comfyui_ready = True
-                                return
-                        except:
-                            pass
-                        time.sleep(2)
-                        logger.info(f"⏳ Waiting for ComfyUI server... ({i*2}s)")
+                    # Wait up to 2 minutes for the server to accept connections
+                    logger.info("⏳ Waiting for ComfyUI server...")
+                    if wait_for_comfyui_port(120):
+                        logger.info("✅ ComfyUI server is ready!")
+                        _comfyui_ready.set()
+                        return
                     
                     logger.warning("⚠️ ComfyUI server took longer than expected to start")
-                    _comfyui_ready = True  # Allow processing anyway
+                    _comfyui_ready.set()  # Allow processing anyway
                     
                 except Exception as e:
                     logger.error(f"❌ Failed to start ComfyUI server: {str(e)}")
-                    _comfyui_ready = True  # Allow processing anyway
+                    _comfyui_ready.set()  # Allow processing anyway
             else:
                 logger.error(f"❌ Setup script failed with code {return_code}")
                 # Log last few lines of setup output for debugging
                 if setup_logs:
                     logger.error("📋 Last setup output lines:")
-                    for line in setup_logs[-10:]:  # Last 10 lines
+                    for line in setup_logs:
                         logger.error(f"  {line}")
             
         except Exception as e:
-            logger.error(f"❌ Setup failed with exception: {str(e)}")
-            import traceback
-            logger.error(f"Traceback: {traceback.format_exc()}")
+            logger.exception(f"❌ Setup failed with exception: {str(e)}")
     
     # Start setup in background thread
     setup_thread = threading.Thread(target=run_setup, daemon=True)
@@ -434,12 +1002,9 @@ def setup_comfyui():
 
 def ensure_comfyui_ready():
     """Ensure ComfyUI is ready before processing jobs"""
-    global _comfyui_ready, _setup_started
-    import requests
-    import time
     
     # If we already confirmed it's ready, skip checks
-    if _comfyui_ready:
+    if _comfyui_ready.is_set():
         logger.info("✅ ComfyUI already confirmed ready")
         return True
     
@@ -450,80 +1015,56 @@ def ensure_comfyui_ready():
     
     comfyui_path = "/workspace/ComfyUI"
     max_wait_time = 600  # 10 minutes max wait for setup
-    check_interval = 10   # Check every 10 seconds
+    delay = 0.25         # Probe backoff, doubling up to 5 seconds
     
     logger.info("⏳ Waiting for ComfyUI to be ready...")
     
-    start_time = time.time()
-    last_log_time = 0
+    start_time = time.monotonic()
+    last_log_time = start_time
     
-    while time.time() - start_time < max_wait_time:
-        current_time = time.time()
-        elapsed = int(current_time - start_time)
-        
-        # Log progress every 30 seconds
-        if current_time - last_log_time >= 30:
-            logger.info(f"⏳ Still waiting for ComfyUI... ({elapsed}s elapsed)")
-            last_log_time = current_time
-        
-        # Check if global ready flag was set by setup thread
-        if _comfyui_ready:
+    while time.monotonic() - start_time < max_wait_time:
+        # Wake as soon as the setup thread reports ready, otherwise probe on backoff
+        if _comfyui_ready.wait(timeout=delay):
             logger.info("✅ ComfyUI ready flag set by setup thread!")
             return True
+        delay = min(delay * 2, 5.0)
         
         # Check if ComfyUI server is responding
-        try:
-            response = requests.get(f"{COMFYUI_API_URL}/", timeout=5)
-            if response.status_code == 200:
-                logger.info("✅ ComfyUI server is responding!")
-                _comfyui_ready = True
-                return True
-        except requests.exceptions.RequestException:
-            pass
+        if comfyui_responding(5):
+            logger.info("✅ ComfyUI server is responding!")
+            _comfyui_ready.set()
+            return True
         
-        # Check if at least the directory exists
-        if os.path.exists(comfyui_path):
-            if elapsed > 60 and elapsed % 60 == 0:  # Every minute after first minute
+        # Log progress every 30 seconds
+        current_time = time.monotonic()
+        if current_time - last_log_time >= 30:
+            elapsed = int(current_time - start_time)
+            if os.path.exists(comfyui_path):
                 logger.info(f"📁 ComfyUI directory exists, still waiting for server... ({elapsed}s)")
-        else:
-            if elapsed > 30 and elapsed % 30 == 0:  # Every 30s for directory check
+            else:
                 logger.info(f"📁 Still waiting for ComfyUI directory... ({elapsed}s)")
-        
-        time.sleep(check_interval)
+            last_log_time = current_time
     
     # Timeout reached - make one final attempt
     logger.warning("⚠️ ComfyUI setup timeout reached, making final check...")
     
     # Final server check
-    try:
-        response = requests.get(f"{COMFYUI_API_URL}/", timeout=10)
-        if response.status_code == 200:
-            logger.info("✅ ComfyUI server responded on final check!")
-            _comfyui_ready = True
-            return True
-    except:
-        pass
+    if comfyui_responding(10):
+        logger.info("✅ ComfyUI server responded on final check!")
+        _comfyui_ready.set()
+        return True
     
     # If ComfyUI directory exists, try to start server manually
     if os.path.exists(comfyui_path):
         logger.warning("⚠️ ComfyUI directory exists but server not responding. Attempting manual start...")
         try:
-            subprocess.Popen([
-                "python3", f"{comfyui_path}/main.py", 
-                "--listen", "--use-sage-attention"
-            ], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            start_comfyui_server(comfyui_path)
             
             # Give it 30 seconds to start
-            for i in range(15):
-                time.sleep(2)
-                try:
-                    response = requests.get(f"{COMFYUI_API_URL}/", timeout=3)
-                    if response.status_code == 200:
-                        logger.info("✅ Manual ComfyUI start successful!")
-                        _comfyui_ready = True
-                        return True
-                except:
-                    pass
+            if wait_for_comfyui_port(30):
+                logger.info("✅ Manual ComfyUI start successful!")
+                _comfyui_ready.set()
+                return True
         except Exception as e:
             logger.error(f"❌ Failed to manually start ComfyUI: {str(e)}")
     
@@ -550,12 +1091,11 @@ if __name__ == "__main__":
     
     # Add a simple health check
     def health_check():
-        global _comfyui_ready, _setup_started
         return {
             "status": "ready",
             "timestamp": time.time(),
             "setup_started": _setup_started,
-            "comfyui_ready": _comfyui_ready
+            "comfyui_ready": _comfyui_ready.is_set()
         }
     
     runpod.serverless.start({
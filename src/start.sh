@@ -297,7 +297,7 @@ echo "✅ All models downloaded successfully!"
 
 # Install FastAPI dependencies for ComfyUI Interface
 echo "📦 Installing FastAPI dependencies..."
-pip install --no-cache-dir fastapi>=0.104.1 uvicorn>=0.24.0 pydantic>=2.5.0 requests>=2.31.0 python-multipart>=0.0.6 websocket-client>=1.6.0
+pip install --no-cache-dir fastapi>=0.104.1 uvicorn>=0.24.0 uvloop>=0.19.0 httptools>=0.6.0 pydantic>=2.5.0 requests>=2.31.0 httpx>=0.25.0 orjson>=3.9.0 cachetools>=5.3.0 python-multipart>=0.0.6 websocket-client>=1.6.0 websockets>=12.0
 
 # poll every 5 s until the PID is gone
   while kill -0 "$BUILD_PID" 2>/dev/null; do
@@ -5,20 +5,39 @@ Usage: python test_api.py
 """
 
 import requests
-import json
 import time
 import base64
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Faster JSON when orjson is installed, stdlib otherwise
+try:
+    import orjson as json
+except ImportError:
+    import json
 
 # Configuration
 API_URL = "http://localhost:8189"  # Change to your RunPod URL
 # For RunPod, use: http://YOUR_POD_ID-8189.proxy.runpod.net
+DEFAULT_TIMEOUT = (3.05, 30)  # (connect, read) seconds for quick API calls
+WAIT_SLICE = 60  # Seconds per /wait request; the RunPod proxy drops requests idle for ~100 s
+
+# Keep-alive session shared by every test, retrying transient proxy failures
+session = requests.Session()
+adapter = HTTPAdapter(max_retries=Retry(total=3, backoff_factor=0.2, status_forcelist=[502, 503, 504]))
+session.mount("http://", adapter)
+session.mount("https://", adapter)
+
+def decode(response):
+    """Parse a JSON response body"""
+    return json.loads(response.content)
 
 def test_health():
     """Test health endpoint"""
     print("🔍 Testing health endpoint...")
-    response = requests.get(f"{API_URL}/health")
+    response = session.get(f"{API_URL}/health", timeout=DEFAULT_TIMEOUT)
     print(f"Status: {response.status_code}")
-    print(f"Response: {response.json()}")
+    print(f"Response: {decode(response)}")
     return response.status_code == 200
 
 def test_generate_video_with_url():
@@ -61,23 +80,29 @@ def test_generate_video_with_url():
         }
     }
     
-    response = requests.post(f"{API_URL}/generate", json=payload)
+    response = session.post(
+        f"{API_URL}/generate",
+        data=json.dumps(payload),
+        headers={"Content-Type": "application/json"},
+        timeout=(3.05, 120)  # Inline base64 images make for large request bodies
+    )
+    data = decode(response)
     print(f"Status: {response.status_code}")
-    print(f"Response: {response.json()}")
+    print(f"Response: {data}")
     
     if response.status_code == 200:
-        return response.json()["job_id"]
+        return data["job_id"]
     return None
 
 def test_workflow_info():
     """Test workflow info endpoint"""
     print("\n🔍 Testing workflow info...")
     
-    response = requests.get(f"{API_URL}/workflow/info")
+    response = session.get(f"{API_URL}/workflow/info", timeout=DEFAULT_TIMEOUT)
     print(f"Status: {response.status_code}")
     
     if response.status_code == 200:
-        data = response.json()
+        data = decode(response)
         print(f"Workflow file: {data['workflow_file']}")
         print(f"Total nodes: {data['total_nodes']}")
         print("Key nodes:")
@@ -85,59 +110,66 @@ def test_workflow_info():
             print(f"  - {node_id}: {info['class_type']} ({info.get('title', '')})")
     return response.status_code == 200
 
-def monitor_job(job_id):
+def monitor_job(job_id, timeout=1800):
     """Monitor job progress"""
     print(f"\n⏳ Monitoring job {job_id}...")
     
-    while True:
-        response = requests.get(f"{API_URL}/status/{job_id}")
-        if response.status_code == 200:
-            job_data = response.json()
-            status = job_data["status"]
-            print(f"Status: {status}")
-            
-            if status == "completed":
-                print("✅ Job completed!")
-                print(f"Output files: {job_data.get('output_files', [])}")
-                return True
-            elif status == "failed":
-                print(f"❌ Job failed: {job_data.get('error', 'Unknown error')}")
-                return False
-            elif status in ["timeout"]:
-                print(f"⏰ Job {status}")
-                return False
-        else:
+    # The server holds each request open until ComfyUI reports completion or
+    # WAIT_SLICE seconds pass; short slices stay under the RunPod proxy's idle cutoff
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        response = session.get(
+            f"{API_URL}/wait/{job_id}",
+            params={"timeout": WAIT_SLICE},
+            timeout=(3.05, WAIT_SLICE + 30)
+        )
+        if response.status_code != 200:
             print(f"Error checking status: {response.status_code}")
             return False
         
-        time.sleep(5)
+        job_data = decode(response)
+        status = job_data["status"]
+        print(f"Status: {status}")
+        
+        if status == "completed":
+            print("✅ Job completed!")
+            print(f"Output files: {job_data.get('outputs', {})}")
+            return True
+        elif status in ["failed", "error"]:
+            print(f"❌ Job failed: {job_data.get('error', 'Unknown error')}")
+            return False
+    
+    print("⏰ Job timeout")
+    return False
 
 def test_download(job_id):
     """Test downloading result"""
     print(f"\n📥 Testing download for job {job_id}...")
     
-    response = requests.get(f"{API_URL}/download/{job_id}")
-    print(f"Status: {response.status_code}")
-    
-    if response.status_code == 200:
-        filename = f"result_{job_id}.mp4"
-        with open(filename, 'wb') as f:
-            f.write(response.content)
-        print(f"✅ Downloaded: {filename}")
-        return True
-    else:
-        print(f"❌ Download failed: {response.text}")
-        return False
+    # Stream to disk so the video is never held in memory whole
+    with session.get(f"{API_URL}/download/{job_id}", stream=True, timeout=(3.05, 60)) as response:
+        print(f"Status: {response.status_code}")
+        
+        if response.status_code == 200:
+            filename = f"result_{job_id}.mp4"
+            with open(filename, 'wb') as f:
+                for chunk in response.iter_content(chunk_size=1024 * 1024):
+                    f.write(chunk)
+            print(f"✅ Downloaded: {filename}")
+            return True
+        else:
+            print(f"❌ Download failed: {response.text}")
+            return False
 
 def test_list_jobs():
     """Test listing all jobs"""
     print("\n📋 Testing job list...")
     
-    response = requests.get(f"{API_URL}/jobs")
+    response = session.get(f"{API_URL}/jobs", timeout=DEFAULT_TIMEOUT)
     print(f"Status: {response.status_code}")
     
     if response.status_code == 200:
-        data = response.json()
+        data = decode(response)
         print(f"Total jobs: {data['total']}")
         for job in data['jobs'][-3:]:  # Show last 3 jobs
             print(f"  - {job['job_id']}: {job['status']}")
@@ -153,8 +185,8 @@ def main():
         return
     
     # Test basic info
-    response = requests.get(f"{API_URL}/")
-    print(f"\nAPI Info: {response.json()}")
+    response = session.get(f"{API_URL}/", timeout=DEFAULT_TIMEOUT)
+    print(f"\nAPI Info: {decode(response)}")
     
     # Test workflow info
     test_workflow_info()